@@ -8,13 +8,57 @@
  * - Applies cleanup rules and a title slide
  */
 
+import crypto from "node:crypto"
 import fs from "node:fs"
+import fsp from "node:fs/promises"
 import path from "node:path"
 import { fileURLToPath } from "node:url"
 
 const __filename = fileURLToPath(import.meta.url)
 const __dirname = path.dirname(__filename)
 
+// Cleanup patterns, hoisted so each cell does not allocate fresh RegExp
+// objects on every cleanMarkdown call.
+const RE_INCELL_SEPARATOR = /^\s*---\s*$/gm
+// OpenAI share links, Colab anchors, and Colab badge images stripped in
+// one alternation so the text is scanned once instead of three times.
+const RE_STRIP_LINKS =
+  /<a href="https:\/\/chat\.openai\.com\/.*?<\/a>|<a href="https:\/\/colab\.research\.google\.com\/.*?<\/a>|\[!\[.*?\]\(https:\/\/colab\.research\.google\.com\/assets\/colab-badge\.svg\)\]\(https:\/\/colab\.research\.google\.com\/[^)]+\)/gs
+const RE_ADMONITION = /!!!\s+(\w+)\s+"([^"]+)"\n\s+(.+?)(?=\n\n|\Z)/gs
+const RE_H1_HEADING = /^#\s+(.+)$/m
+
+const FRONTMATTER = `---\nmarp: true\ntheme: custom\nmath: katex\npaginate: true\n---\n\n\n<!-- _class: title -->\n\n`
+
+// Decode a list-form base64 payload (nbformat stores long payloads as a
+// list of line chunks) without first joining it into one large string.
+// Chunks are cut at 4-character base64 boundaries, with the remainder
+// carried into the next chunk.
+const decodeBase64Chunks = (chunks) => {
+  const buffers = []
+  let carry = ""
+  for (const chunk of chunks) {
+    const joined = carry + chunk.replace(/\s+/g, "")
+    const usable = joined.length - (joined.length % 4)
+    if (usable) buffers.push(Buffer.from(joined.slice(0, usable), "base64"))
+    carry = joined.slice(usable)
+  }
+  if (carry) buffers.push(Buffer.from(carry, "base64"))
+  return buffers
+}
+
+// Upper bound on concurrently open image files; keeps descriptor use
+// flat however many figures a notebook holds.
+const MAX_CONCURRENT_IMAGE_WRITES = 8
+
+const writeImageFile = async (filePath, buffers) => {
+  const handle = await fsp.open(filePath, "w")
+  try {
+    await handle.writev(buffers)
+  } finally {
+    await handle.close()
+  }
+}
+
 class SlideConverter {
   constructor(inputPath, outputPath = null) {
     this.inputPath = path.resolve(inputPath)
@@ -37,9 +81,13 @@ class SlideConverter {
     this.imagePrefix = stem.replace(/[-\s]/g, "_")
     this.imageCounter = 1
     this.slides = []
+    this.slideCount = 0
+    this.imageHashes = new Map()
+    this.imageWriteLanes = []
+    this.imageWriteIndex = 0
   }
 
-  convert() {
+  async convert() {
     console.log(`Converting: ${this.inputPath}`)
     console.log(`Output: ${this.outputPath}`)
     console.log("")
@@ -53,12 +101,19 @@ class SlideConverter {
     throw new Error(`Unsupported file type: ${this.fileType}`)
   }
 
-  convertNotebook() {
+  async convertNotebook() {
     console.log("📓 Processing Jupyter notebook...")
     const notebook = JSON.parse(fs.readFileSync(this.inputPath, "utf-8"))
-    const title = this.extractNotebookTitle(notebook)
+    const cells = notebook.cells || []
+    // Join list-form sources once so title extraction and the main cell
+    // walk do not each re-join the same cell.
+    for (const cell of cells) {
+      cell._source = this.readCellSource(cell)
+    }
+    const title = this.extractNotebookTitle(cells)
     this.addFrontmatter(title)
-    this.processNotebookCells(notebook)
+    this.processNotebookCells(cells)
+    await Promise.all(this.imageWriteLanes)
     this.writeOutput()
     return this.outputPath
   }
@@ -73,43 +128,60 @@ class SlideConverter {
     return this.outputPath
   }
 
-  extractNotebookTitle(notebook) {
-    for (const cell of notebook.cells || []) {
+  extractNotebookTitle(cells) {
+    for (const cell of cells) {
       if (cell.cell_type === "markdown") {
-        const source = this.readCellSource(cell)
-        const match = source.match(/^#\s+(.+)$/m)
-        if (match) return match[1].trim()
+        const title = this.findH1Title(cell._source)
+        if (title) return title
       }
     }
     return this.defaultTitle()
   }
 
   extractMarkdownTitle(content) {
-    const match = content.match(/^#\s+(.+)$/m)
-    if (match) return match[1].trim()
-    return this.defaultTitle()
+    return this.findH1Title(content) || this.defaultTitle()
+  }
+
+  findH1Title(source) {
+    // The title is almost always the very first line, so try a plain
+    // string check before falling back to the multiline regex.
+    const firstLine = source.trimStart().split("\n", 1)[0]
+    if (firstLine.startsWith("# ")) {
+      const title = firstLine.slice(2).trim()
+      if (title) return title
+    }
+    const match = source.match(RE_H1_HEADING)
+    return match ? match[1].trim() : null
   }
 
   defaultTitle() {
     return path
       .basename(this.inputPath, this.fileType)
-      .replace(/[-_]/g, " ")
-      .replace(/\s+/g, " ")
+      .replace(/[-_\s]+/g, " ")
       .trim()
       .replace(/\b\w/g, (c) => c.toUpperCase())
   }
 
   addFrontmatter(title) {
-    const frontmatter = `---\nmarp: true\ntheme: custom\nmath: katex\npaginate: true\n---\n\n\n<!-- _class: title -->\n\n`
     const singleLineTitle = title.split(/\r?\n/).join(" ").trim()
-    this.slides.push(frontmatter)
-    this.slides.push(`# ${singleLineTitle}\n\n---\n\n`)
+    this.pushSlide(`${FRONTMATTER}# ${singleLineTitle}\n\n---\n\n`)
+    this.slideCount += 2
+  }
+
+  // Slides are stored as UTF-8 buffers so writeOutput can hand the list
+  // to writev as-is, with no join or encode pass at the end.
+  pushSlide(text) {
+    this.slides.push(Buffer.from(text, "utf-8"))
   }
 
   writeOutput() {
-    const fullContent = this.slides.join("")
-    fs.writeFileSync(this.outputPath, fullContent, "utf-8")
-    const slideCount = (fullContent.match(/\n---\n/g) || []).length
+    const fd = fs.openSync(this.outputPath, "w")
+    try {
+      fs.writevSync(fd, this.slides)
+    } finally {
+      fs.closeSync(fd)
+    }
+    const slideCount = this.slideCount
     const imageCount = this.imageCounter - 1
     console.log("✓ Conversion complete!")
     console.log(`  Output: ${this.outputPath}`)
@@ -118,45 +190,50 @@ class SlideConverter {
     console.log("")
   }
 
-  processNotebookCells(notebook) {
-    const cells = notebook.cells || []
+  processNotebookCells(cells) {
+    const pushSlide = this.pushSlide.bind(this)
     let skipFirstTitle = true
     let firstContent = true
 
-    for (const cell of cells) {
-      if (cell.cell_type === "markdown") {
-        const source = this.readCellSource(cell)
+    for (let i = 0; i < cells.length; i += 1) {
+      const cell = cells[i]
+      // Drop the cell reference as soon as it is processed so large
+      // base64 output payloads become collectable during the walk
+      // instead of living until the whole notebook is converted.
+      cells[i] = null
+      const cellType = cell.cell_type
+      if (cellType === "markdown") {
+        const source = cell._source
         if (skipFirstTitle && source.trim().startsWith("# ")) {
           skipFirstTitle = false
           continue
         }
         const cleaned = this.cleanMarkdown(source)
         if (!cleaned) continue
-        if (!firstContent) {
-          this.slides.push("\n---\n\n")
-        }
-        this.slides.push(cleaned)
-        this.slides.push("\n\n")
+        const separator = firstContent ? "" : "\n---\n\n"
+        if (separator) this.slideCount += 1
+        pushSlide(`${separator}${cleaned}\n\n`)
         firstContent = false
       }
 
-      if (cell.cell_type === "code") {
+      if (cellType === "code") {
         const outputs = cell.outputs || []
+        if (!outputs.length) continue
         const imagePaths = []
-        const title = this.extractCodeTitle(cell)
 
         for (const output of outputs) {
+          if (!output?.data?.["image/png"]) continue
           const imgPath = this.extractImage(output)
           if (imgPath) imagePaths.push(imgPath)
         }
 
         if (imagePaths.length) {
-          if (title) {
-            this.slides.push(`## ${title}\n\n`)
-          }
+          const title = this.extractCodeTitle(cell)
+          const parts = title ? [`## ${title}\n\n`] : []
           for (const imgPath of imagePaths) {
-            this.slides.push(`![width:500px](${imgPath})\n\n`)
+            parts.push(`![width:500px](${imgPath})\n\n`)
           }
+          pushSlide(parts.join(""))
           firstContent = false
         }
       }
@@ -170,30 +247,26 @@ class SlideConverter {
     if (!cleaned) return
     const finalText = this.cleanMarkdown(cleaned)
     if (finalText) {
-      this.slides.push(finalText)
-      this.slides.push("\n\n")
+      this.pushSlide(`${finalText}\n\n`)
     }
   }
 
   cleanMarkdown(text) {
+    // Most cells contain none of these constructs, so gate each regex
+    // pass on a cheap literal substring check.
     let cleaned = text
-    cleaned = cleaned.replace(/^\s*---\s*$/gm, "")
-    cleaned = cleaned.replace(
-      /<a href="https:\/\/chat\.openai\.com\/.*?<\/a>/gs,
-      ""
-    )
-    cleaned = cleaned.replace(
-      /<a href="https:\/\/colab\.research\.google\.com\/.*?<\/a>/gs,
-      ""
-    )
-    cleaned = cleaned.replace(
-      /\[!\[.*?\]\(https:\/\/colab\.research\.google\.com\/assets\/colab-badge\.svg\)\]\(https:\/\/colab\.research\.google\.com\/[^)]+\)/g,
-      ""
-    )
-    cleaned = cleaned.replace(
-      /!!!\s+(\w+)\s+"([^"]+)"\n\s+(.+?)(?=\n\n|\Z)/gs,
-      "> **$2**\n>\n> $3"
-    )
+    if (cleaned.includes("---")) {
+      cleaned = cleaned.replace(RE_INCELL_SEPARATOR, "")
+    }
+    if (
+      cleaned.includes("chat.openai.com") ||
+      cleaned.includes("colab.research.google.com")
+    ) {
+      cleaned = cleaned.replace(RE_STRIP_LINKS, "")
+    }
+    if (cleaned.includes("!!!")) {
+      cleaned = cleaned.replace(RE_ADMONITION, "> **$2**\n>\n> $3")
+    }
     return cleaned.trim()
   }
 
@@ -201,21 +274,54 @@ class SlideConverter {
     if (!output || !output.data) return null
     const data = output.data
     if (!data["image/png"]) return null
-    const imgData = Array.isArray(data["image/png"])
-      ? data["image/png"].join("")
-      : data["image/png"]
-    const imgBytes = Buffer.from(imgData, "base64")
+    const payload = data["image/png"]
+
+    // Hash the raw base64 payload so duplicate figures are written (and
+    // decoded) only once; repeats reuse the first file.
+    const hash = crypto.createHash("sha256")
+    if (Array.isArray(payload)) {
+      for (const chunk of payload) hash.update(chunk)
+    } else {
+      hash.update(payload)
+    }
+    const digest = hash.digest("hex").slice(0, 16)
+    const existingPath = this.imageHashes.get(digest)
+    if (existingPath) {
+      console.log(`  ✓ Reused: ${path.basename(existingPath)}`)
+      return existingPath
+    }
+
+    // The notebook's PNG bytes are written verbatim — base64 decode
+    // only, never an image decode/re-encode round trip.
+    const imgBuffers = Array.isArray(payload)
+      ? decodeBase64Chunks(payload)
+      : [Buffer.from(payload, "base64")]
     const imgFilename = `${this.imagePrefix}_${String(this.imageCounter).padStart(2, "0")}.png`
     const imgPath = path.join(this.imagesDir, imgFilename)
-    fs.writeFileSync(imgPath, imgBytes)
+    // Queue the write so disk IO overlaps with the rest of the cell
+    // walk; convertNotebook awaits the batch before writing the slides.
+    this.queueImageWrite(imgPath, imgBuffers)
     console.log(`  ✓ Extracted: ${imgFilename}`)
     this.imageCounter += 1
-    return `images/${imgFilename}`
+    const relativePath = `images/${imgFilename}`
+    this.imageHashes.set(digest, relativePath)
+    return relativePath
+  }
+
+  // Round-robin writes across a fixed number of lanes, chaining within
+  // each lane, so at most MAX_CONCURRENT_IMAGE_WRITES descriptors are
+  // open at any point during the walk.
+  queueImageWrite(filePath, buffers) {
+    const index = this.imageWriteIndex % MAX_CONCURRENT_IMAGE_WRITES
+    this.imageWriteIndex += 1
+    const lane = this.imageWriteLanes[index]
+    this.imageWriteLanes[index] = lane
+      ? lane.then(() => writeImageFile(filePath, buffers))
+      : writeImageFile(filePath, buffers)
   }
 
   extractCodeTitle(cell) {
-    const source = this.readCellSource(cell)
-    const lines = source.split(/\r?\n/)
+    const lines = cell._source.split(/\r?\n/)
     for (const line of lines) {
       const stripped = line.trim()
       if (!stripped) continue
@@ -237,7 +343,7 @@ class SlideConverter {
   }
 }
 
-const main = () => {
+const main = async () => {
   const inputPath = process.argv[2]
   const outputPath = process.argv[3] || null
 
@@ -252,7 +358,7 @@ const main = () => {
   }
 
   const converter = new SlideConverter(inputPath, outputPath)
-  const outputFile = converter.convert()
+  const outputFile = await converter.convert()
   console.log("=".repeat(60))
   console.log("Next steps:")
   console.log(`  1. Review: ${outputFile}`)
@@ -260,4 +366,4 @@ const main = () => {
   console.log("=".repeat(60))
 }
 
-main()
+await main()
@@ -0,0 +1,68 @@
+import { execFileSync } from "node:child_process"
+import fs from "node:fs"
+import os from "node:os"
+import path from "node:path"
+import { fileURLToPath } from "node:url"
+import { describe, expect, it } from "vitest"
+
+const converterScript = fileURLToPath(
+  new URL("../../resources/scripts/convert_to_slides.mjs", import.meta.url)
+)
+
+// 1x1 transparent PNG.
+const pngBase64 =
+  "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+const pngBytes = Buffer.from(pngBase64, "base64")
+
+const writeNotebook = (payload: string | string[]) => {
+  const dir = fs.mkdtempSync(path.join(os.tmpdir(), "slides-convert-"))
+  const notebookPath = path.join(dir, "sample.ipynb")
+  const notebook = {
+    cells: [
+      { cell_type: "markdown", source: ["# Sample\n"] },
+      {
+        cell_type: "code",
+        source: ["plot()"],
+        outputs: [
+          { output_type: "display_data", data: { "image/png": payload } },
+        ],
+      },
+    ],
+    metadata: {},
+    nbformat: 4,
+    nbformat_minor: 5,
+  }
+  fs.writeFileSync(notebookPath, JSON.stringify(notebook))
+  return { dir, notebookPath }
+}
+
+const convert = (notebookPath: string) =>
+  execFileSync(process.execPath, [converterScript, notebookPath], {
+    encoding: "utf-8",
+  })
+
+describe("convert_to_slides image extraction", () => {
+  it("writes string payloads byte-for-byte", () => {
+    const { dir, notebookPath } = writeNotebook(pngBase64)
+    convert(notebookPath)
+
+    const extracted = fs.readFileSync(
+      path.join(dir, "slides", "images", "sample_01.png")
+    )
+    expect(extracted.equals(pngBytes)).toBe(true)
+  })
+
+  it("writes chunked list payloads byte-for-byte", () => {
+    const chunks = []
+    for (let i = 0; i < pngBase64.length; i += 30) {
+      chunks.push(`${pngBase64.slice(i, i + 30)}\n`)
+    }
+    const { dir, notebookPath } = writeNotebook(chunks)
+    convert(notebookPath)
+
+    const extracted = fs.readFileSync(
+      path.join(dir, "slides", "images", "sample_01.png")
+    )
+    expect(extracted.equals(pngBytes)).toBe(true)
+  })
+})